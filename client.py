@@ -1,10 +1,10 @@
 import asyncio
-import json
 import logging
 import os
 from typing import Optional
 
 import aiohttp
+import orjson
 from playwright.async_api import async_playwright
 
 logging.basicConfig(level=logging.INFO)
@@ -16,15 +16,28 @@ class BrowserClient:
         self.api_url = api_url
         self.session_id: Optional[str] = None
         self.cdp_url: Optional[str] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.cleanup()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                base_url=self.api_url,
+                connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=60),
+            )
+        return self._session
 
     async def create_session(self, user_id: str = "demo-user") -> bool:
         """Create a new browser session through the management API"""
         try:
-            async with aiohttp.ClientSession() as session:
-                response = await session.post(
-                    f"{self.api_url}/sessions", json={"user_id": user_id}
-                )
-
+            session = await self._get_session()
+            async with session.post("/sessions", json={"user_id": user_id}) as response:
                 if response.status != 201:
                     logger.error(f"Failed to create session: {await response.text()}")
                     return False
@@ -35,6 +48,11 @@ class BrowserClient:
                 logger.info(
                     f"Created session {self.session_id} with CDP: {self.cdp_url}"
                 )
+
+            async with session.get(f"/sessions/{self.session_id}/ready") as response:
+                if response.status != 200:
+                    logger.error(f"Browser not ready: {await response.text()}")
+                    return False
                 return True
 
         except Exception as e:
@@ -99,33 +117,36 @@ class BrowserClient:
             return None
 
         try:
-            async with aiohttp.ClientSession() as session:
-                response = await session.get(
-                    f"{self.api_url}/sessions/{self.session_id}/logs?limit={limit}"
-                )
-                return await response.json() if response.status == 200 else None
+            session = await self._get_session()
+            async with session.get(
+                f"/sessions/{self.session_id}/logs", params={"limit": limit}
+            ) as response:
+                if response.status != 200:
+                    return None
+                return await response.json(loads=orjson.loads)
         except Exception as e:
             logger.error(f"Failed to get logs: {e}")
             return None
 
     async def cleanup(self):
-        """Terminate the browser session"""
-        if not self.session_id:
-            return
-
+        """Terminate the browser session and release the HTTP session"""
         try:
-            async with aiohttp.ClientSession() as session:
-                await session.delete(f"{self.api_url}/sessions/{self.session_id}")
-                logger.info(f"Session {self.session_id} terminated")
+            if self.session_id:
+                session = await self._get_session()
+                async with session.delete(f"/sessions/{self.session_id}"):
+                    logger.info(f"Session {self.session_id} terminated")
+                self.session_id = None
         except Exception as e:
             logger.error(f"Cleanup failed: {e}")
+        finally:
+            if self._session is not None:
+                await self._session.close()
+                self._session = None
 
 
 async def main():
     api_url = os.getenv("MANAGEMENT_API_URL", "http://localhost:8000")
-    client = BrowserClient(api_url)
-
-    try:
+    async with BrowserClient(api_url) as client:
         if not await client.create_session():
             return
 
@@ -136,10 +157,8 @@ async def main():
         if logs:
             print("\nSession Logs:")
             for idx, event in enumerate(logs.get("events", [])[:10]):
-                print(f"{idx+1}. {json.dumps(event, indent=2)[:200]}...")
-
-    finally:
-        await client.cleanup()
+                blob = orjson.dumps(event, option=orjson.OPT_INDENT_2)[:200]
+                print(f"{idx+1}. {blob.decode(errors='replace')}...")
 
 
 if __name__ == "__main__":
@@ -1,22 +1,26 @@
 import asyncio
-import json
+import collections
+import functools
+import itertools
 import logging
 import os
 import signal
-import subprocess
-import threading
+import socket
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, Optional
 
-import psutil
+import aiohttp
+import orjson
 import uvicorn
 import websockets
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +33,24 @@ app.add_middleware(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CDP_HOST = os.environ.get("CDP_HOST", "host.docker.internal")
+CHROME_BIN = os.environ.get("CHROME_BIN", "google-chrome")
+EVENT_CAP = int(os.environ.get("BROWSERMON_EVENT_CAP", "10000"))
+STARTUP_TIMEOUT = 10.0
+TERMINATE_GRACE = 5.0
+LOG_LINE_LIMIT = 1024 * 1024
+SESSION_TTL_NS = int(os.environ.get("BROWSERMON_SESSION_TTL", "3600")) * 1_000_000_000
+SWEEP_INTERVAL = 30
+
+CHROME_ARGS = (
+    "--remote-debugging-address=0.0.0.0",
+    "--disable-gpu",
+    "--headless",
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-dev-shm-usage",
+)
+
 
 class SessionRequest(BaseModel):
     user_id: Optional[str] = None
@@ -45,121 +67,169 @@ class BrowserSession:
         self.session_id = session_id
         self.process = process
         self.port = port
-        self.created_at = datetime.now().isoformat()
-        self.events = []
+        self.created_ns = time.time_ns()
+        self.stop_event = asyncio.Event()
+        self.ready = asyncio.Event()
+        self.failed = False
+        self.browser_info = None
+        self.events = collections.deque(maxlen=EVENT_CAP)
+
+    @functools.cached_property
+    def created_at(self):
+        return datetime.fromtimestamp(self.created_ns / 1e9, tz=timezone.utc).isoformat()
 
 
 browser_sessions: Dict[str, BrowserSession] = {}
 monitoring_tasks = {}
+log_tasks = {}
+ready_tasks = {}
+reaper_tasks = set()
+http_session: Optional[aiohttp.ClientSession] = None
+sweeper_task: Optional[asyncio.Task] = None
 
+_ENABLE_FRAMES = [
+    orjson.dumps({"id": i, "method": method}).decode()
+    for i, method in enumerate(("Network.enable", "Page.enable", "Runtime.enable"), 1)
+]
 
-def log_output(process, session_id):
+
+async def log_output(process, session_id):
     """Read process output and log it"""
     try:
-        for line in iter(process.stdout.readline, ''):
-            logger.info(f"Chrome session {session_id}: {line.strip()}")
+        while True:
+            try:
+                line = await process.stdout.readline()
+            except ValueError:
+                # readline() drops a line longer than the stream limit; keep
+                # draining so Chrome never blocks on a full pipe.
+                logger.warning(f"Chrome session {session_id}: output line too long")
+                continue
+            if not line:
+                break
+            logger.info(
+                f"Chrome session {session_id}: {line.decode(errors='replace').rstrip()}"
+            )
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         logger.error(f"Error logging output for {session_id}: {e}")
 
 
-async def monitor_browser_session(session_id: str, port: int):
-    cdp_host = os.environ.get("CDP_HOST", "host.docker.internal")
-    cdp_url = f"ws://localhost:{port}/json/version"
-    browser_info_response = None
+async def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared HTTP session, creating it on first use"""
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2))
+    return http_session
+
 
-    for _ in range(20):
-        try:
-            async with websockets.connect(cdp_url) as websocket:
-                browser_info_response = await websocket.recv()
+async def _wait_ready(session: BrowserSession):
+    """Wait for Chrome's DevTools endpoint, then signal session.ready"""
+    version_url = f"http://localhost:{session.port}/json/version"
+    http = await get_http_session()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STARTUP_TIMEOUT
+    attempt = 0
+    try:
+        while True:
+            if session.process.returncode is not None:
+                logger.error(
+                    f"Browser process for {session.session_id} exited "
+                    f"with code {session.process.returncode}"
+                )
                 break
-        except Exception as e:
-            await asyncio.sleep(0.5)
-    else:
-        logger.error(f"Could not connect to browser on port {port}")
+            try:
+                async with http.get(version_url) as response:
+                    response.raise_for_status()
+                    session.browser_info = await response.json()
+                    return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            if loop.time() >= deadline:
+                logger.error(f"Could not connect to browser on port {session.port}")
+                break
+            await asyncio.sleep(min(0.5, 0.02 * 2**attempt))
+            attempt += 1
+    finally:
+        session.failed = session.browser_info is None
+        session.ready.set()
+
+
+async def monitor_browser_session(session_id: str):
+    session = browser_sessions.get(session_id)
+    if session is None:
+        return
+    events_append = session.events.append
+    stop_event = session.stop_event
+
+    await session.ready.wait()
+    if session.failed:
         return
 
-    browser_info = json.loads(browser_info_response)
-    webSocketDebuggerUrl = browser_info.get("webSocketDebuggerUrl", "").replace(
-        "localhost", cdp_host
+    webSocketDebuggerUrl = session.browser_info.get("webSocketDebuggerUrl", "").replace(
+        "localhost", CDP_HOST
     )
 
     try:
         async with websockets.connect(webSocketDebuggerUrl) as websocket:
-            await websocket.send(json.dumps({"id": 1, "method": "Network.enable"}))
-            await websocket.send(json.dumps({"id": 2, "method": "Page.enable"}))
-            await websocket.send(json.dumps({"id": 3, "method": "Runtime.enable"}))
-
-            while session_id in browser_sessions:
-                try:
-                    message = await asyncio.wait_for(websocket.recv(), timeout=1.0)
-                    event = json.loads(message)
-                    if session_id in browser_sessions:
-                        browser_sessions[session_id].events.append(event)
-                except asyncio.TimeoutError:
-                    continue
-                except Exception as e:
-                    logger.error(f"Error monitoring session {session_id}: {e}")
-                    break
+            await asyncio.gather(*(websocket.send(f) for f in _ENABLE_FRAMES))
+
+            stop_task = asyncio.create_task(stop_event.wait())
+            recv_task = None
+            try:
+                while not stop_event.is_set():
+                    recv_task = asyncio.create_task(websocket.recv())
+                    done, _ = await asyncio.wait(
+                        {recv_task, stop_task}, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if stop_task in done:
+                        break
+                    try:
+                        events_append(recv_task.result())
+                    except Exception as e:
+                        logger.error(f"Error monitoring session {session_id}: {e}")
+                        break
+            finally:
+                stop_task.cancel()
+                if recv_task is not None:
+                    recv_task.cancel()
     except Exception as e:
         logger.error(f"Failed to connect to CDP: {e}")
 
 
-@app.post("/sessions", response_model=SessionResponse)
+@app.post("/sessions", response_model=SessionResponse, status_code=201)
 async def create_session(request: SessionRequest):
     session_id = str(uuid.uuid4())
     port = find_free_port()
 
-    chrome_bin = os.environ.get("CHROME_BIN", "google-chrome")
-    cmd = [
-        chrome_bin,
-        f"--remote-debugging-port={port}",
-        "--remote-debugging-address=0.0.0.0",  
-        "--disable-gpu",
-        "--headless",  
-        "--no-sandbox",
-        "--disable-setuid-sandbox",
-        "--disable-dev-shm-usage",
-    ]
-
     try:
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
+        process = await asyncio.create_subprocess_exec(
+            CHROME_BIN,
+            f"--remote-debugging-port={port}",
+            *CHROME_ARGS,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            limit=LOG_LINE_LIMIT,
         )
     except Exception as e:
+        release_port(port)
         logger.error(f"Failed to start Chrome: {e}")
         raise HTTPException(status_code=500, detail="Failed to start browser")
 
-    log_thread = threading.Thread(
-        target=log_output, args=(process, session_id), daemon=True
-    )
-    log_thread.start()
-
-    await asyncio.sleep(1)
-    if process.poll() is not None:
-        output = (
-            process.stdout.read() if process.stdout else "Process exited immediately"
-        )
-        logger.error(f"Browser process failed: {output}")
-        raise HTTPException(status_code=500, detail=output)
+    log_tasks[session_id] = asyncio.create_task(log_output(process, session_id))
 
-    browser_sessions[session_id] = BrowserSession(
-        session_id=session_id, process=process, port=port
-    )
+    session = BrowserSession(session_id=session_id, process=process, port=port)
+    browser_sessions[session_id] = session
+    ready_tasks[session_id] = asyncio.create_task(_wait_ready(session))
 
-    monitoring_task = asyncio.create_task(monitor_browser_session(session_id, port))
+    monitoring_task = asyncio.create_task(monitor_browser_session(session_id))
     monitoring_tasks[session_id] = monitoring_task
 
-    cdp_host = os.environ.get("CDP_HOST", "host.docker.internal")
-    cdp_url = f"ws://{cdp_host}:{port}"
+    cdp_url = f"ws://{CDP_HOST}:{port}"
     return SessionResponse(
         session_id=session_id,
         cdp_url=cdp_url,
-        created_at=browser_sessions[session_id].created_at,
+        created_at=session.created_at,
     )
 
 
@@ -172,68 +242,143 @@ async def get_session(session_id: str):
     return {
         "session_id": session.session_id,
         "created_at": session.created_at,
-        "cdp_url": f"ws://{os.environ.get('CDP_HOST', 'host.docker.internal')}:{session.port}",
-        "alive": is_process_running(session.process.pid),
+        "cdp_url": f"ws://{CDP_HOST}:{session.port}",
+        "alive": session.process.returncode is None,
     }
 
 
+@app.get("/sessions/{session_id}/ready")
+async def wait_session_ready(session_id: str, timeout: float = STARTUP_TIMEOUT + 5):
+    if session_id not in browser_sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    session = browser_sessions[session_id]
+    try:
+        await asyncio.wait_for(session.ready.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Browser not ready yet")
+
+    if session.failed:
+        raise HTTPException(status_code=500, detail="Failed to start browser")
+    return {"session_id": session_id, "ready": True}
+
+
+@app.get("/sessions/{session_id}/logs")
+async def get_session_logs(session_id: str, limit: int = 20):
+    if session_id not in browser_sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    events = browser_sessions[session_id].events
+    recent = list(itertools.islice(reversed(events), max(0, limit)))
+    recent.reverse()
+    # Events are stored as the raw CDP frames, which are already valid JSON.
+    return Response(
+        content='{"events":[' + ",".join(recent) + "]}",
+        media_type="application/json",
+    )
+
+
 @app.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
     if session_id not in browser_sessions:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    session = browser_sessions[session_id]
+    _terminate(session_id)
+    return {"status": "success", "message": f"Session {session_id} terminated"}
+
+
+def _terminate(session_id, sig=signal.SIGTERM):
+    """Stop a session's browser and tasks and forget it"""
+    session = browser_sessions.pop(session_id)
+    session.stop_event.set()
 
     try:
-        if is_process_running(session.process.pid):
-            os.kill(session.process.pid, signal.SIGTERM)
+        # Chrome is reaped by the event loop, so its PID may already be reused.
+        if session.process.returncode is None:
+            session.process.send_signal(sig)
             logger.info(f"Terminated process {session.process.pid}")
     except Exception as e:
         logger.error(f"Error terminating process: {e}")
 
-    if session_id in monitoring_tasks:
-        monitoring_tasks[session_id].cancel()
-        del monitoring_tasks[session_id]
-
-    del browser_sessions[session_id]
-    return {"status": "success", "message": f"Session {session_id} terminated"}
+    for tasks in (monitoring_tasks, ready_tasks):
+        if session_id in tasks:
+            tasks.pop(session_id).cancel()
 
+    reaper = asyncio.create_task(_reap(session))
+    reaper_tasks.add(reaper)
+    reaper.add_done_callback(reaper_tasks.discard)
 
-def find_free_port(start_port=9222, end_port=9322):
-    import socket
 
-    for port in range(start_port, end_port + 1):
+async def _reap(session: BrowserSession):
+    """Wait for Chrome to exit before its port goes back to the pool"""
+    # The log task keeps draining stdout so a dying Chrome never blocks on it.
+    try:
+        await asyncio.wait_for(session.process.wait(), timeout=TERMINATE_GRACE)
+    except asyncio.TimeoutError:
+        logger.warning(f"Process {session.process.pid} ignored SIGTERM, killing it")
+        session.process.kill()
+        await session.process.wait()
+    if session.session_id in log_tasks:
+        log_tasks.pop(session.session_id).cancel()
+    release_port(session.port)
+
+
+async def _sweeper():
+    """Periodically evict sessions whose browser died or outlived SESSION_TTL"""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        now = time.time_ns()
+        for session_id, session in list(browser_sessions.items()):
+            expired = now - session.created_ns > SESSION_TTL_NS
+            dead = session.process.returncode is not None or session.failed
+            if expired or dead:
+                logger.info(f"Evicting session {session_id}")
+                _terminate(session_id)
+
+
+PORT_RANGE = (9222, 9322)
+free_ports = collections.deque(range(PORT_RANGE[0], PORT_RANGE[1] + 1))
+
+
+def find_free_port():
+    """Allocate the least recently released debugging port that binds"""
+    for _ in range(len(free_ports)):
+        port = free_ports.popleft()
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             try:
-                s.bind(('', port))
+                s.bind(("", port))
                 return port
             except OSError:
-                continue
-    raise IOError(f"No free ports in range {start_port}-{end_port}")
+                free_ports.append(port)
+    raise IOError(f"No free ports in range {PORT_RANGE[0]}-{PORT_RANGE[1]}")
 
 
-def is_process_running(pid):
-    try:
-        return psutil.pid_exists(pid)
-    except:
-        return False
+def release_port(port):
+    free_ports.append(port)
+
+
+@app.on_event("startup")
+async def startup_event():
+    global sweeper_task
+    sweeper_task = asyncio.create_task(_sweeper())
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    for session_id, session in list(browser_sessions.items()):
-        try:
-            if is_process_running(session.process.pid):
-                os.kill(session.process.pid, signal.SIGKILL)
-        except Exception as e:
-            logger.error(f"Error killing process {session.process.pid}: {e}")
+    if sweeper_task is not None:
+        sweeper_task.cancel()
 
-        if session_id in monitoring_tasks:
-            monitoring_tasks[session_id].cancel()
+    for session_id in list(browser_sessions):
+        _terminate(session_id, signal.SIGKILL)
+    if reaper_tasks:
+        await asyncio.wait(reaper_tasks, timeout=TERMINATE_GRACE + 1)
 
-    browser_sessions.clear()
-    monitoring_tasks.clear()
+    if http_session is not None:
+        await http_session.close()
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Sessions live in this process, so stay on a single worker. "auto" picks
+    # uvloop and httptools when installed (uvloop is skipped on Windows).
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="auto", http="auto")